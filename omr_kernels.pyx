@@ -0,0 +1,39 @@
+# cython: language_level=3
+"""Compiled bubble-counting kernel, used by OMRProcessor when Numba is unavailable
+
+Build in place with:  cythonize -i omr_kernels.pyx
+"""
+import numpy as np
+cimport cython
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+@cython.cdivision(True)
+cpdef score_bubbles(const unsigned char[:, ::1] thresh, int rows, int cols):
+    """Count white pixels in every option region of the thresholded grid"""
+    cdef Py_ssize_t height = thresh.shape[0]
+    cdef Py_ssize_t width = thresh.shape[1]
+    cdef Py_ssize_t col_width = width // cols
+    cdef Py_ssize_t row_height = height // rows
+    cdef Py_ssize_t option_height = row_height // 4
+    cdef Py_ssize_t col, row, opt, x, y, x_start, y_start
+    cdef int total
+
+    out = np.zeros((cols * rows, 4), dtype=np.int32)
+    cdef int[:, ::1] counts = out
+
+    with nogil:
+        for col in range(cols):
+            x_start = col * col_width
+            for row in range(rows):
+                for opt in range(4):
+                    y_start = row * row_height + opt * option_height
+                    total = 0
+                    for y in range(y_start, y_start + option_height):
+                        for x in range(x_start, x_start + col_width):
+                            if thresh[y, x]:
+                                total += 1
+                    counts[col * rows + row, opt] = total
+
+    return out
@@ -1,104 +1,249 @@
 import cv2
 import numpy as np
 import json
+import os
+
+try:
+    import numba as nb
+except ImportError:  # Numba is optional; detect_bubbles falls back to NumPy
+    nb = None
+
+try:
+    import omr_kernels  # Compiled from omr_kernels.pyx (cythonize -i omr_kernels.pyx)
+except ImportError:  # The Cython kernel is optional as well
+    omr_kernels = None
+
+if nb is not None:
+    @nb.njit(parallel=True, fastmath=True, cache=True)
+    def _score_generic(thresh, rows, cols):
+        """Count white pixels in every option region of the thresholded grid in one pass"""
+        height, width = thresh.shape
+        col_width = width // cols
+        row_height = height // rows
+        option_height = row_height // 4
+        
+        out = np.zeros((cols * rows, 4), np.int32)
+        for col in nb.prange(cols):
+            x_start = col * col_width
+            for row in range(rows):
+                for opt in range(4):
+                    y_start = row * row_height + opt * option_height
+                    total = 0
+                    for y in range(y_start, y_start + option_height):
+                        for x in range(x_start, x_start + col_width):
+                            if thresh[y, x]:
+                                total += 1
+                    out[col * rows + row, opt] = total
+        return out
+
+    @nb.njit(parallel=True, fastmath=True, cache=True)
+    def _score_5x20x4(thresh):
+        """_score_generic specialized for the standard 5 x 20 grid of 4 options
+        
+        The grid shape is a compile-time constant and the 4 option rows are
+        accumulated side by side, one counter each, in a single sweep.
+        """
+        height, width = thresh.shape
+        col_width = width // 5
+        row_height = height // 20
+        option_height = row_height // 4
+        
+        out = np.zeros((100, 4), np.int32)
+        for col in nb.prange(5):
+            x_start = col * col_width
+            for row in range(20):
+                y_a = row * row_height
+                y_b = y_a + option_height
+                y_c = y_b + option_height
+                y_d = y_c + option_height
+                s0 = s1 = s2 = s3 = 0
+                for y in range(option_height):
+                    for x in range(x_start, x_start + col_width):
+                        s0 += thresh[y_a + y, x] != 0
+                        s1 += thresh[y_b + y, x] != 0
+                        s2 += thresh[y_c + y, x] != 0
+                        s3 += thresh[y_d + y, x] != 0
+                q = col * 20 + row
+                out[q, 0] = s0
+                out[q, 1] = s1
+                out[q, 2] = s2
+                out[q, 3] = s3
+        return out
+
+    def _score(thresh, rows, cols):
+        """Run the specialized kernel for the standard grid, else the generic one"""
+        if (rows, cols) == (20, 5):
+            return _score_5x20x4(thresh)
+        return _score_generic(thresh, rows, cols)
 
 class OMRProcessor:
-    def __init__(self, answer_key):
+    OPTIONS = np.array(['a', 'b', 'c', 'd'], dtype=object)
+    TARGET_H = 1000  # Working height for the grid analysis
+    PREVIEW_W = 800  # Width of the processed-image preview returned to callers
+    GRID_COLS, GRID_ROWS = 5, 20
+    # A bubble is marked when more than MARK_THRESHOLD of every MARK_AREA
+    # pixels of its option region are white (50 px of a 12 x 200 region)
+    MARK_THRESHOLD, MARK_AREA = 50, 2400
+    STATUSES = ("Not Attempted", "Correct", "Incorrect")
+    
+    def __init__(self, answer_key, use_gpu=False):
         self.answer_key = answer_key
         
+        # Optionally run preprocessing and the bubble reduction on a CUDA
+        # GPU through CuPy, which is only imported when requested
+        self.use_gpu = use_gpu
+        if use_gpu:
+            try:
+                import cupy
+                import cupyx.scipy.ndimage
+            except ImportError as e:
+                raise ImportError("use_gpu=True requires CuPy (e.g. pip install cupy-cuda12x)") from e
+            self._cp = cupy
+            self._cp_ndimage = cupyx.scipy.ndimage
+        
+        # Answer key as an array indexed directly by question number, covering
+        # at least every question on the sheet (index 0 and any missing
+        # questions hold '?', which never matches)
+        num_questions = max(self.GRID_COLS * self.GRID_ROWS, max(answer_key, default=0))
+        self._key = np.full(num_questions + 1, '?', dtype='<U1')
+        for q_num, answer in answer_key.items():
+            self._key[q_num] = answer
+        
+        # Let OpenCV use its optimized (IPP) and multi-threaded code paths
+        cv2.setUseOptimized(True)
+        cv2.setNumThreads(os.cpu_count() or 1)
+        
+        # 5x5 Gaussian kernel applied as two 1D passes (rows, then columns)
+        self._gk = cv2.getGaussianKernel(5, 0)
+        
+        # Compile the bubble kernels now so the first sheet doesn't pay for it
+        if nb is not None:
+            dummy = np.zeros((4 * self.GRID_ROWS, self.GRID_COLS), np.uint8)
+            _score_5x20x4(dummy)
+            _score_generic(dummy, self.GRID_ROWS, self.GRID_COLS)
+        
+    def downsample_image(self, image):
+        """Shrink the image to the working height used for bubble detection"""
+        scale = self.TARGET_H / image.shape[0]
+        if scale < 1:
+            image = cv2.resize(image, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+        return image
+
+    def make_preview(self, image):
+        """Shrink an image to the preview width, keeping its aspect ratio"""
+        height, width = image.shape[:2]
+        if width > self.PREVIEW_W:
+            size = (self.PREVIEW_W, int(self.PREVIEW_W * height / width))
+            image = cv2.resize(image, size, interpolation=cv2.INTER_AREA)
+        return image
+
     def preprocess_image(self, image):
         """Preprocess the image for OMR detection"""
         gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-        blurred = cv2.GaussianBlur(gray, (5, 5), 0)
-        thresh = cv2.threshold(blurred, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)[1]
-        return thresh
+        # Blur and threshold in place to avoid extra full-size buffers
+        cv2.sepFilter2D(gray, -1, self._gk, self._gk, dst=gray)
+        cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU, dst=gray)
+        return gray
 
     def detect_bubbles(self, thresh):
-        """Detect bubbles and extract answers"""
-        height, width = thresh.shape
-        bubbles = {}
+        """Detect bubbles and return a (questions, 4) int32 array of white pixel counts
         
+        thresh may also be a (sheets, height, width) stack, in which case the
+        result has shape (sheets, questions, 4).
+        """
         # Define grid parameters (5 columns, 20 rows)
-        cols, rows = 5, 20
+        cols, rows = self.GRID_COLS, self.GRID_ROWS
+        
+        # Single host-side sheets use a compiled kernel when one is available
+        if isinstance(thresh, np.ndarray) and thresh.ndim == 2:
+            if nb is not None:
+                return _score(thresh, rows, cols)
+            if omr_kernels is not None:
+                return omr_kernels.score_bubbles(np.ascontiguousarray(thresh), rows, cols)
+        
+        batch_shape = thresh.shape[:-2]
+        height, width = thresh.shape[-2:]
         col_width = width // cols
         row_height = height // rows
         
-        for col in range(cols):
-            for row in range(rows):
-                q_num = col * rows + row + 1
-                
-                # Define bubble area for this question
-                x_start = col * col_width
-                y_start = row * row_height
-                x_end = x_start + col_width
-                y_end = y_start + row_height
-                
-                # Extract the bubble region
-                bubble_region = thresh[y_start:y_end, x_start:x_end]
-                
-                # Split into 4 options (A, B, C, D)
-                option_height = row_height // 4
-                options_intensity = {}
-                
-                for opt_idx, option in enumerate(['a', 'b', 'c', 'd']):
-                    y_opt_start = opt_idx * option_height
-                    y_opt_end = y_opt_start + option_height
-                    
-                    option_region = bubble_region[y_opt_start:y_opt_end, :]
-                    intensity = np.sum(option_region) / 255  # Count white pixels
-                    options_intensity[option] = intensity
-                
-                bubbles[q_num] = options_intensity
-        
-        return bubbles
-
-    def extract_answers(self, bubbles):
-        """Extract answers from bubble intensities"""
-        answers = {}
-        for q_num, options in bubbles.items():
-            # Find option with maximum intensity (marked bubble)
-            if options:
-                marked_option = max(options.items(), key=lambda x: x[1])[0]
-                # Check if bubble is actually marked (above threshold)
-                if options[marked_option] > 50:  # Threshold for marked bubble
-                    answers[q_num] = marked_option
-                else:
-                    answers[q_num] = None  # No bubble marked
-            else:
-                answers[q_num] = None
+        # Split each question cell into 4 options (A, B, C, D)
+        option_height = row_height // 4
+        
+        # View the grid as (..., cols, rows, cell height, cell width) without copying
+        grid = thresh[..., :rows * row_height, :cols * col_width]
+        grid = grid.reshape(*batch_shape, rows, row_height, cols, col_width)
+        grid = np.moveaxis(grid, -2, -4)
         
-        return answers
+        # Count white pixels of every option region in one pass
+        options = grid[..., :4 * option_height, :].reshape(
+            *batch_shape, cols, rows, 4, option_height, col_width)
+        intensities = np.count_nonzero(options, axis=(-2, -1)).astype(np.int32)
+        
+        # Row q_num - 1 holds the option intensities of question q_num
+        return intensities.reshape(*batch_shape, cols * rows, 4)
 
-    def evaluate_answers(self, extracted_answers):
-        """Evaluate extracted answers against answer key"""
-        results = {}
-        score = 0
+    def extract_answers(self, bubbles, image_shape):
+        """Extract answers from bubble intensities
         
-        for q_num, student_answer in extracted_answers.items():
-            correct_answer = self.answer_key.get(q_num)
-            
-            if student_answer is None:
-                results[q_num] = {
-                    "status": "Not Attempted",
-                    "marked": "None",
-                    "correct": correct_answer,
-                    "is_correct": False
-                }
-            elif student_answer == correct_answer:
-                results[q_num] = {
-                    "status": "Correct",
-                    "marked": student_answer,
-                    "correct": correct_answer,
-                    "is_correct": True
-                }
-                score += 1
-            else:
-                results[q_num] = {
-                    "status": "Incorrect",
-                    "marked": student_answer,
-                    "correct": correct_answer,
-                    "is_correct": False
-                }
+        image_shape is the shape of the thresholded image the intensities
+        were counted on, which sets the marked-bubble threshold.
+        """
+        marked = self._marked_options(bubbles, self._mark_threshold(image_shape))
+        return dict(zip(range(1, len(marked) + 1), marked.tolist()))
+
+    def _mark_threshold(self, image_shape):
+        """Minimum white pixel count of a marked bubble on an image of this shape"""
+        height, width = image_shape[-2:]
+        option_area = (height // self.GRID_ROWS // 4) * (width // self.GRID_COLS)
+        return option_area * self.MARK_THRESHOLD // self.MARK_AREA
+
+    def _marked_options(self, bubbles, threshold):
+        """Return the marked option per question (None if unmarked) as an array"""
+        # Find option with maximum intensity (marked bubble)
+        marked_idx = bubbles.argmax(axis=-1)
+        # Check if bubble is actually marked (above threshold)
+        is_marked = bubbles.max(axis=-1) > threshold
+        return np.where(is_marked, self.OPTIONS[marked_idx], None)
+
+    def evaluate_answers(self, extracted_answers, detailed=True):
+        """Evaluate extracted answers against answer key
+        
+        extracted_answers is either a {q_num: option} dict, graded for exactly
+        the questions it contains, or an array of options for questions 1..N.
+        The per-question results dict is only built when detailed is True
+        (otherwise it is None).
+        """
+        if isinstance(extracted_answers, dict):
+            q_nums = np.fromiter(extracted_answers.keys(), dtype=np.int64, count=len(extracted_answers))
+            extracted = np.empty(len(extracted_answers), dtype=object)
+            extracted[:] = list(extracted_answers.values())
+        else:
+            extracted = np.asarray(extracted_answers, dtype=object)
+            q_nums = np.arange(1, len(extracted) + 1)
+        
+        # Correct option per question; '?' (never matches) outside the key
+        in_key = (q_nums >= 1) & (q_nums < len(self._key))
+        correct = np.where(in_key, self._key[np.where(in_key, q_nums, 0)], '?')
+        
+        # 0 = Not Attempted, 1 = Correct, 2 = Incorrect
+        status_codes = np.where(np.equal(extracted, None), 0,
+                                np.where(extracted == correct, 1, 2))
+        score = int((status_codes == 1).sum())
+        
+        if not detailed:
+            return score, None
+        
+        results = {
+            q_num: {
+                "status": self.STATUSES[code],
+                "marked": "None" if marked is None else marked,
+                "correct": None if answer == '?' else answer,
+                "is_correct": code == 1
+            }
+            for q_num, code, marked, answer in zip(
+                q_nums.tolist(), status_codes.tolist(),
+                extracted.tolist(), correct.tolist())
+        }
         
         return score, results
 
@@ -109,23 +254,148 @@ class OMRProcessor:
         if image is None:
             raise ValueError(f"Could not load image from path: {image_path}")
         
-        # Preprocess image
-        processed_image = self.preprocess_image(image)
+        return self._process_image(image)
+
+    def process_omr_bytes(self, buf):
+        """Process an OMR sheet from encoded image bytes (e.g. an upload)"""
+        return self._process_image(self.decode_image(buf))
+
+    def decode_image(self, buf):
+        """Decode encoded image bytes into a BGR image"""
+        # Decode straight from memory, no temporary file needed
+        image = cv2.imdecode(np.frombuffer(buf, np.uint8), cv2.IMREAD_COLOR)
+        if image is None:
+            raise ValueError("Could not decode image from the provided bytes")
+        return image
+
+    def process_batch(self, images):
+        """Process several decoded OMR sheet images
+        
+        Each sheet goes through the same pipeline as process_omr_sheet, so
+        it gets the same answers as when processed alone. The results are a
+        list with one process_omr_sheet-style dict per image.
+        """
+        return [self._process_image(image) for image in images]
+
+    def _process_image(self, image):
+        """Run the OMR pipeline on a decoded BGR image"""
+        # Bubble detection does not need the full scan resolution
+        image = self.downsample_image(image)
+        
+        if self.use_gpu:
+            processed_image, bubbles = self._process_on_gpu(image)
+        else:
+            # Preprocess image
+            processed_image = self.preprocess_image(image)
+            del image
+            
+            # Detect bubbles
+            bubbles = self.detect_bubbles(processed_image)
+        
+        # Extract answers
+        marked = self._marked_options(bubbles, self._mark_threshold(processed_image.shape))
+        
+        return self._build_results(processed_image, marked)
+
+    def _process_on_gpu(self, images):
+        """Threshold BGR image(s) and count bubble pixels on the GPU
+        
+        images is one (height, width, 3) image or an (N, height, width, 3)
+        stack. Mirrors preprocess_image + detect_bubbles and returns the
+        thresholded image(s) and bubble counts as host arrays.
+        """
+        cp, ndimage = self._cp, self._cp_ndimage
+        d_images = cp.asarray(images)
+        
+        # BGR -> grayscale with the same weights and rounding as cv2.COLOR_BGR2GRAY,
+        # accumulated in float32 so no full-size float64 temporaries are made
+        gray = d_images[..., 0].astype(cp.float32)
+        gray *= 0.114
+        for channel, weight in ((1, 0.587), (2, 0.299)):
+            gray += d_images[..., channel].astype(cp.float32) * weight
+        gray = cp.rint(gray)
+        
+        # Same separable 5-tap Gaussian as on the CPU; 'mirror' is OpenCV's
+        # default reflect-101 border
+        kernel = cp.asarray(self._gk.ravel(), dtype=cp.float32)
+        for axis in (-2, -1):
+            gray = ndimage.correlate1d(gray, kernel, axis=axis, mode='mirror')
+        gray = cp.clip(cp.rint(gray), 0, 255).astype(cp.uint8)
         
-        # Detect bubbles and extract answers
-        bubbles = self.detect_bubbles(processed_image)
-        extracted_answers = self.extract_answers(bubbles)
+        # Otsu threshold per sheet from one 256-bin histogram each
+        sheets = gray.reshape(-1, *gray.shape[-2:])
+        num_sheets = sheets.shape[0]
+        offsets = cp.arange(num_sheets, dtype=cp.int64)[:, None, None] * 256
+        hist = cp.bincount((sheets + offsets).ravel(), minlength=256 * num_sheets)
+        prob = hist.reshape(num_sheets, 256) / (sheets.shape[1] * sheets.shape[2])
+        omega = cp.cumsum(prob, axis=1)
+        mu = cp.cumsum(prob * cp.arange(256), axis=1)
+        between = (mu[:, -1:] * omega - mu) ** 2
+        denom = omega * (1 - omega)
+        sigma_b = cp.where(denom > 0, between, 0) / cp.where(denom > 0, denom, 1)
+        otsu = sigma_b.argmax(axis=1)
+        
+        # THRESH_BINARY_INV: dark (marked) pixels become white
+        d_thresh = cp.where(sheets > otsu[:, None, None], 0, 255).astype(cp.uint8)
+        d_thresh = d_thresh.reshape(gray.shape)
+        
+        # Only the small (..., questions, 4) count array is needed for
+        # grading; the thresholds come back for the preview
+        bubbles = self.detect_bubbles(d_thresh)
+        return cp.asnumpy(d_thresh), cp.asnumpy(bubbles)
+
+    def _build_results(self, processed_image, marked):
+        """Evaluate one sheet's marked options and assemble its results dict"""
+        extracted_answers = dict(zip(range(1, len(marked) + 1), marked.tolist()))
         
         # Evaluate answers
-        score, detailed_results = self.evaluate_answers(extracted_answers)
+        score, detailed_results = self.evaluate_answers(marked)
+        
+        # Only a small preview of the thresholded sheet is returned, with
+        # its PNG encoding done once here rather than on every display.
+        # The preview is binarized again after shrinking, and kept bit-packed
+        # (1 bit per pixel) so results held in caches or session state stay
+        # small; unpack_processed_image rebuilds it.
+        preview = self.make_preview(processed_image)
+        preview = cv2.threshold(preview, 127, 255, cv2.THRESH_BINARY)[1]
         
         return {
             "total_score": score,
             "detailed_results": detailed_results,
-            "processed_image": processed_image,
+            "summary": self._summarize(detailed_results),
+            "processed_image_bits": np.packbits(preview, axis=1),
+            "processed_image_shape": preview.shape,
+            "processed_image_png": cv2.imencode('.png', preview)[1].tobytes(),
             "extracted_answers": extracted_answers
         }
 
+    def unpack_processed_image(self, results):
+        """Rebuild the thresholded preview (0/255 uint8) from its packed bits
+        
+        This is the image that results['processed_image_png'] encodes; the
+        results dict has no 'processed_image' key.
+        """
+        width = results['processed_image_shape'][1]
+        return np.unpackbits(results['processed_image_bits'], axis=1, count=width) * np.uint8(255)
+
+    def _summarize(self, detailed_results):
+        """Group question numbers by status in a single pass"""
+        correct, incorrect, not_attempted = [], [], []
+        for q_num, res in detailed_results.items():
+            if res['status'] == 'Correct':
+                correct.append(q_num)
+            elif res['status'] == 'Incorrect':
+                incorrect.append(q_num)
+            else:
+                not_attempted.append(q_num)
+        
+        return {
+            "attempted": len(correct) + len(incorrect),
+            "correct": correct,
+            "incorrect": incorrect,
+            "not_attempted": not_attempted
+        }
+
     def save_results(self, results, output_path):
         """Save results to JSON file"""
         with open(output_path, 'w') as f:
@@ -138,14 +408,13 @@ class OMRProcessor:
         report += f"Total Score: {results['total_score']}/100\n"
         report += f"Percentage: {(results['total_score']/100)*100:.2f}%\n\n"
         
+        summary = results.get('summary') or self._summarize(results['detailed_results'])
+        
         # Count attempts
-        attempted = sum(1 for q, res in results['detailed_results'].items() 
-                       if res['status'] != 'Not Attempted')
-        report += f"Questions Attempted: {attempted}/100\n\n"
+        report += f"Questions Attempted: {summary['attempted']}/100\n\n"
         
         # Incorrect questions
-        incorrect = [q for q, res in results['detailed_results'].items() 
-                    if res['status'] == 'Incorrect']
+        incorrect = summary['incorrect']
         if incorrect:
             report += f"Incorrect Questions ({len(incorrect)}): {', '.join(map(str, incorrect))}\n"
         
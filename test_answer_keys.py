@@ -1,7 +1,68 @@
+import importlib.util
+import os
 import unittest
+import cv2
+import numpy as np
+import omr_processor
 from omr_processor import OMRProcessor
 from answer_keys import ANSWER_KEY
 
+try:
+    import scipy.ndimage
+except ImportError:
+    scipy = None
+
+SAMPLE_SHEET = os.path.join(os.path.dirname(__file__), "data", "Set A", "Img1.jpeg")
+SMALL_SHEET = os.path.join(os.path.dirname(__file__), "data", "Set B", "Img22.jpeg")  # 746px high
+
+def _unwrap(value):
+    return value.array if isinstance(value, DeviceArray) else value
+
+def _wrap(value):
+    return DeviceArray(value) if isinstance(value, np.ndarray) else value
+
+class DeviceArray(np.lib.mixins.NDArrayOperatorsMixin):
+    """NumPy-backed array that, like cupy.ndarray, is not an np.ndarray"""
+    
+    def __init__(self, array):
+        self.array = array
+    
+    def __array_ufunc__(self, ufunc, method, *inputs, **kwargs):
+        if 'out' in kwargs:
+            kwargs['out'] = tuple(map(_unwrap, kwargs['out']))
+        return _wrap(getattr(ufunc, method)(*map(_unwrap, inputs), **kwargs))
+    
+    def __array_function__(self, func, types, args, kwargs):
+        return _wrap(func(*map(_unwrap, args), **kwargs))
+    
+    def __getitem__(self, key):
+        return _wrap(self.array[key])
+    
+    def __getattr__(self, name):
+        attr = getattr(self.array, name)
+        if callable(attr):
+            return lambda *args, **kwargs: _wrap(attr(*map(_unwrap, args), **kwargs))
+        return _wrap(attr)
+
+class NumpyAsCupy:
+    """Stand-in for the cupy module so the GPU code path can run on the CPU"""
+    
+    @staticmethod
+    def asarray(a, dtype=None):
+        return DeviceArray(np.asarray(a, dtype))
+    
+    asnumpy = staticmethod(_unwrap)
+    
+    def __getattr__(self, name):
+        return getattr(np, name)
+
+class ScipyAsCupyxNdimage:
+    """Stand-in for cupyx.scipy.ndimage that keeps results as DeviceArray"""
+    
+    @staticmethod
+    def correlate1d(input, weights, **kwargs):
+        return DeviceArray(scipy.ndimage.correlate1d(_unwrap(input), _unwrap(weights), **kwargs))
+
 class TestOMRSystem(unittest.TestCase):
     
     def setUp(self):
@@ -68,6 +129,151 @@ class TestOMRSystem(unittest.TestCase):
         
         for q in range(51, 101):
             self.assertEqual(results[q]['status'], 'Not Attempted')
+    
+    def test_evaluate_answers_sparse_dict(self):
+        """Test that a dict is graded for exactly the questions it contains"""
+        score, results = self.processor.evaluate_answers({1: 'a', 2: 'b', 101: 'c'})
+        self.assertEqual(score, 1)
+        self.assertEqual(sorted(results), [1, 2, 101])
+        self.assertEqual(results[1]['status'], 'Correct')
+        self.assertEqual(results[2]['status'], 'Incorrect')
+        self.assertEqual(results[101]['status'], 'Incorrect')
+        self.assertIsNone(results[101]['correct'])
+    
+    def test_partial_answer_key(self):
+        """Test that an answer key shorter than the sheet still grades every question"""
+        partial_key = {q: ANSWER_KEY[q] for q in range(1, 51)}
+        results = OMRProcessor(partial_key).process_omr_sheet(SAMPLE_SHEET)
+        self.assertEqual(len(results['detailed_results']), 100)
+        for q in range(51, 101):
+            self.assertIsNone(results['detailed_results'][q]['correct'])
+            self.assertNotEqual(results['detailed_results'][q]['status'], 'Correct')
+        
+        score, results = OMRProcessor({}).evaluate_answers({1: 'a', 2: None})
+        self.assertEqual(score, 0)
+        self.assertEqual(results[1]['status'], 'Incorrect')
+        self.assertEqual(results[2]['status'], 'Not Attempted')
+    
+    def test_evaluate_answers_array(self):
+        """Test evaluation of an answer array aligned with question numbers"""
+        answers = [ANSWER_KEY[q] if q <= 60 else None for q in range(1, 101)]
+        score, results = self.processor.evaluate_answers(answers)
+        self.assertEqual(score, 60)
+        self.assertEqual(results[60]['status'], 'Correct')
+        self.assertEqual(results[61]['status'], 'Not Attempted')
+        self.assertEqual(results[61]['marked'], 'None')
+        
+        score, results = self.processor.evaluate_answers(answers, detailed=False)
+        self.assertEqual(score, 60)
+        self.assertIsNone(results)
+    
+    def test_process_omr_bytes_matches_path(self):
+        """Test that decoding from bytes gives the same results as reading from disk"""
+        with open(SAMPLE_SHEET, 'rb') as f:
+            from_bytes = self.processor.process_omr_bytes(f.read())
+        from_path = self.processor.process_omr_sheet(SAMPLE_SHEET)
+        self.assertEqual(from_bytes['total_score'], from_path['total_score'])
+        self.assertEqual(from_bytes['extracted_answers'], from_path['extracted_answers'])
+    
+    def test_unpack_processed_image(self):
+        """Test that the packed preview unpacks to a binary image of the right shape"""
+        results = self.processor.process_omr_sheet(SAMPLE_SHEET)
+        image = self.processor.unpack_processed_image(results)
+        self.assertEqual(image.shape, results['processed_image_shape'])
+        self.assertTrue(set(np.unique(image).tolist()) <= {0, 255})
+        
+        # The packed bits hold exactly the image shown from the PNG
+        png = cv2.imdecode(np.frombuffer(results['processed_image_png'], np.uint8),
+                           cv2.IMREAD_UNCHANGED)
+        np.testing.assert_array_equal(png, image)
+        self.assertIs(type(results), dict)
+        self.assertNotIn('processed_image', results)
+    
+    def test_process_batch(self):
+        """Test that processing several sheets matches processing each sheet alone"""
+        sheets = [SAMPLE_SHEET, SMALL_SHEET, SAMPLE_SHEET]
+        batch = self.processor.process_batch([cv2.imread(path) for path in sheets])
+        self.assertEqual(len(batch), 3)
+        for path, results in zip(sheets, batch):
+            single = self.processor.process_omr_sheet(path)
+            self.assertEqual(results['extracted_answers'], single['extracted_answers'])
+            self.assertEqual(results['total_score'], single['total_score'])
+        
+        self.assertEqual(self.processor.process_batch([cv2.imread(SAMPLE_SHEET)])[0]['extracted_answers'],
+                         self.processor.process_omr_sheet(SAMPLE_SHEET)['extracted_answers'])
+    
+    def test_downsample_and_mark_threshold(self):
+        """Test that only tall sheets are shrunk and the threshold follows the option area"""
+        small = cv2.imread(SMALL_SHEET)
+        self.assertIs(self.processor.downsample_image(small), small)
+        self.assertEqual(self.processor.downsample_image(cv2.imread(SAMPLE_SHEET)).shape[0],
+                         OMRProcessor.TARGET_H)
+        
+        # 50 px of a 12 x 200 option region, kept as an integer pixel count
+        self.assertEqual(self.processor._mark_threshold((1000, 1000)), 50)
+        self.assertEqual(self.processor._mark_threshold((1000, 1069)), 53)
+        self.assertEqual(self.processor._mark_threshold((746, 867)), 32)
+        self.assertIsInstance(self.processor._mark_threshold((746, 867)), int)
+    
+    def test_process_omr_bytes_invalid(self):
+        """Test that undecodable bytes raise a ValueError"""
+        with self.assertRaises(ValueError):
+            self.processor.process_omr_bytes(b'not an image')
+    
+    def test_counting_backends_agree(self):
+        """Test that every available bubble-counting backend gives identical counts"""
+        rows, cols = OMRProcessor.GRID_ROWS, OMRProcessor.GRID_COLS
+        for path in (SAMPLE_SHEET, SMALL_SHEET):
+            thresh = self.processor.preprocess_image(
+                self.processor.downsample_image(cv2.imread(path)))
+            
+            # The NumPy reshape path is the one used for (N, H, W) stacks
+            expected = self.processor.detect_bubbles(thresh[None])[0]
+            backends = {}
+            if omr_processor.nb is not None:
+                backends['numba 5x20x4'] = omr_processor._score_5x20x4(thresh)
+                backends['numba generic'] = omr_processor._score_generic(thresh, rows, cols)
+            if omr_processor.omr_kernels is not None:
+                backends['cython'] = omr_processor.omr_kernels.score_bubbles(thresh, rows, cols)
+            
+            for name, counts in backends.items():
+                with self.subTest(backend=name, sheet=os.path.basename(path)):
+                    self.assertEqual(counts.dtype, np.int32)
+                    np.testing.assert_array_equal(counts, expected)
+    
+    @unittest.skipIf(scipy is None, "SciPy is needed to stand in for cupyx.scipy.ndimage")
+    def test_gpu_path_matches_cpu(self):
+        """Test the GPU pipeline against the OpenCV one, with NumPy/SciPy standing in for CuPy"""
+        gpu_processor = OMRProcessor(ANSWER_KEY)
+        gpu_processor.use_gpu = True
+        gpu_processor._cp = NumpyAsCupy()
+        gpu_processor._cp_ndimage = ScipyAsCupyxNdimage()
+        
+        for path in (SAMPLE_SHEET, SMALL_SHEET):
+            image = self.processor.downsample_image(cv2.imread(path))
+            
+            # Device arrays take the reshape path of detect_bubbles, not the 2D kernels
+            thresh = self.processor.preprocess_image(image)
+            for host in (thresh, np.stack([thresh, thresh])):
+                counts = self.processor.detect_bubbles(DeviceArray(host))
+                self.assertIsInstance(counts, DeviceArray)
+                np.testing.assert_array_equal(counts.array, self.processor.detect_bubbles(host))
+            
+            thresh, bubbles = gpu_processor._process_on_gpu(image)
+            # Float vs fixed-point rounding may flip a handful of edge pixels
+            self.assertLessEqual(np.count_nonzero(thresh != self.processor.preprocess_image(image)), 10)
+            self.assertEqual(gpu_processor.process_omr_sheet(path)['extracted_answers'],
+                             self.processor.process_omr_sheet(path)['extracted_answers'])
+        
+        images = [cv2.imread(SAMPLE_SHEET), cv2.imread(SAMPLE_SHEET)]
+        self.assertEqual([r['extracted_answers'] for r in gpu_processor.process_batch(images)],
+                         [r['extracted_answers'] for r in self.processor.process_batch(images)])
+    
+    @unittest.skipIf(importlib.util.find_spec("cupy") is not None, "CuPy is installed")
+    def test_use_gpu_without_cupy(self):
+        """Test that requesting the GPU path without CuPy raises ImportError"""
+        with self.assertRaises(ImportError):
+            OMRProcessor(ANSWER_KEY, use_gpu=True)
 
 if __name__ == '__main__':
     # Run tests
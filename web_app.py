@@ -1,9 +1,8 @@
 import streamlit as st
 import cv2
 import numpy as np
+import pandas as pd
 from PIL import Image
-import tempfile
-import os
 from omr_processor import OMRProcessor
 from answer_keys import ANSWER_KEY
 
@@ -43,130 +42,186 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
+STATUS_LABELS = {
+    "Correct": "✅ Correct",
+    "Incorrect": "❌ Incorrect",
+    "Not Attempted": "⏭️ Not Attempted"
+}
+
+@st.cache_resource
+def get_processor():
+    """Build the OMR processor once and reuse it across reruns"""
+    return OMRProcessor(ANSWER_KEY)
+
+@st.cache_data
+def process_upload(file_bytes):
+    """Process an uploaded sheet, reusing the results for identical uploads"""
+    return get_processor().process_omr_bytes(file_bytes)
+
+def render_results(processor, results):
+    """Render the score card, analysis and downloads for one processed sheet"""
+    summary = results['summary']
+    incorrect_questions = summary['incorrect']
+    not_attempted = summary['not_attempted']
+    attempted = summary['attempted']
+    
+    # Score card
+    st.header("📊 Results")
+    col1, col2, col3 = st.columns(3)
+    
+    with col1:
+        st.metric("Total Score", f"{results['total_score']}/100")
+    
+    with col2:
+        percentage = (results['total_score'] / 100) * 100
+        st.metric("Percentage", f"{percentage:.2f}%")
+    
+    with col3:
+        st.metric("Attempted", f"{attempted}/100")
+    
+    # Progress bar
+    st.progress(results['total_score'] / 100)
+    
+    # Detailed results
+    st.header("📋 Detailed Analysis")
+    
+    # Incorrect questions
+    if incorrect_questions:
+        st.warning(f"❌ Incorrect Answers: {len(incorrect_questions)}")
+        st.write(", ".join(map(str, incorrect_questions)))
+    else:
+        st.success("🎉 All attempted answers are correct!")
+    
+    # Not attempted questions
+    if not_attempted:
+        st.info(f"📝 Not Attempted: {len(not_attempted)} questions")
+    
+    # Processed image
+    st.header("🖼️ Processed Image")
+    st.image(results['processed_image_png'], caption="Thresholded OMR Sheet", use_column_width=True)
+    
+    # Detailed question view
+    render_details(results)
+    
+    # Download report
+    st.header("📥 Download Results")
+    report = processor.generate_report(results)
+    
+    st.download_button(
+        label="📄 Download Evaluation Report",
+        data=report,
+        file_name="omr_evaluation_report.txt",
+        mime="text/plain"
+    )
+
+def render_details(results):
+    """Render the question-wise tabs from one table of all questions"""
+    st.header("🔍 Question-wise Results")
+    
+    # One table for all questions, sliced per tab
+    details_df = pd.DataFrame(
+        [
+            (
+                f"Q{q_num}",
+                STATUS_LABELS[res['status']],
+                res['marked'].upper() if res['status'] != 'Not Attempted' else "-",
+                (res['correct'] or "-").upper()
+            )
+            for q_num, res in results['detailed_results'].items()
+        ],
+        columns=["Q", "Status", "Marked", "Correct"]
+    )
+    
+    # Create tabs for different question ranges
+    tab1, tab2, tab3, tab4, tab5 = st.tabs(["1-20", "21-40", "41-60", "61-80", "81-100"])
+    
+    tabs = [tab1, tab2, tab3, tab4, tab5]
+    
+    for i, tab in enumerate(tabs):
+        start_q = i * 20 + 1
+        end_q = start_q + 19
+        
+        with tab:
+            st.subheader(f"Questions {start_q}-{end_q}")
+            st.dataframe(
+                details_df.iloc[start_q - 1:end_q],
+                hide_index=True,
+                use_container_width=True
+            )
+
+def render_batch_overview(file_names, all_results):
+    """Render a one-row-per-sheet summary table for a multi-sheet upload"""
+    st.header("🗂️ Batch Overview")
+    overview_df = pd.DataFrame(
+        [
+            (
+                name,
+                f"{results['total_score']}/100",
+                results['summary']['attempted'],
+                len(results['summary']['incorrect']),
+                len(results['summary']['not_attempted'])
+            )
+            for name, results in zip(file_names, all_results)
+        ],
+        columns=["Sheet", "Score", "Attempted", "Incorrect", "Not Attempted"]
+    )
+    st.dataframe(overview_df, hide_index=True, use_container_width=True)
+
+@st.fragment
+def render_selected_results(processor, file_names, all_results):
+    """Render one sheet's results; picking another sheet reruns only this block"""
+    results = all_results[0]
+    if len(all_results) > 1:
+        selected = st.selectbox(
+            "Show detailed results for",
+            range(len(file_names)),
+            format_func=lambda i: file_names[i]
+        )
+        results = all_results[selected]
+    
+    render_results(processor, results)
+
 def main():
     st.markdown('<h1 class="main-header">📝 Professional OMR Evaluation System</h1>', unsafe_allow_html=True)
     
     # File upload section
-    st.header("📤 Upload OMR Sheet")
-    uploaded_file = st.file_uploader(
-        "Choose an OMR sheet image (JPG, JPEG, PNG)",
+    st.header("📤 Upload OMR Sheets")
+    uploaded_files = st.file_uploader(
+        "Choose one or more OMR sheet images (JPG, JPEG, PNG)",
         type=["jpg", "jpeg", "png"],
-        help="Upload a clear image of the filled OMR sheet"
+        accept_multiple_files=True,
+        help="Upload clear images of the filled OMR sheets"
     )
     
-    if uploaded_file is not None:
-        # Save uploaded file to temporary location
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".jpg") as tmp_file:
-            tmp_file.write(uploaded_file.getvalue())
-            temp_image_path = tmp_file.name
-        
+    if uploaded_files:
         try:
             # Initialize OMR processor
-            processor = OMRProcessor(ANSWER_KEY)
+            processor = get_processor()
             
-            # Process the OMR sheet
-            with st.spinner("🔍 Processing OMR sheet..."):
-                results = processor.process_omr_sheet(temp_image_path)
+            # Process the OMR sheets
+            with st.spinner("🔍 Processing OMR sheets..."):
+                # Cached per sheet, so adding a file only processes the new one
+                all_results = [process_upload(f.getvalue()) for f in uploaded_files]
             
             # Display results
-            st.success("✅ OMR sheet processed successfully!")
-            
-            # Score card
-            st.header("📊 Results")
-            col1, col2, col3 = st.columns(3)
-            
-            with col1:
-                st.metric("Total Score", f"{results['total_score']}/100")
-            
-            with col2:
-                percentage = (results['total_score'] / 100) * 100
-                st.metric("Percentage", f"{percentage:.2f}%")
-            
-            with col3:
-                attempted = sum(1 for q, res in results['detailed_results'].items() 
-                              if res['status'] != 'Not Attempted')
-                st.metric("Attempted", f"{attempted}/100")
-            
-            # Progress bar
-            st.progress(results['total_score'] / 100)
-            
-            # Detailed results
-            st.header("📋 Detailed Analysis")
-            
-            # Incorrect questions
-            incorrect_questions = [
-                q for q, res in results['detailed_results'].items() 
-                if res['status'] == 'Incorrect'
-            ]
-            
-            if incorrect_questions:
-                st.warning(f"❌ Incorrect Answers: {len(incorrect_questions)}")
-                st.write(", ".join(map(str, incorrect_questions)))
+            file_names = [f.name for f in uploaded_files]
+            if len(all_results) == 1:
+                st.success("✅ OMR sheet processed successfully!")
             else:
-                st.success("🎉 All attempted answers are correct!")
-            
-            # Not attempted questions
-            not_attempted = [
-                q for q, res in results['detailed_results'].items() 
-                if res['status'] == 'Not Attempted'
-            ]
-            
-            if not_attempted:
-                st.info(f"📝 Not Attempted: {len(not_attempted)} questions")
-            
-            # Processed image
-            st.header("🖼️ Processed Image")
-            st.image(results['processed_image'], caption="Thresholded OMR Sheet", use_column_width=True)
-            
-            # Detailed question view
-            st.header("🔍 Question-wise Results")
+                st.success(f"✅ {len(all_results)} OMR sheets processed successfully!")
+                render_batch_overview(file_names, all_results)
             
-            # Create tabs for different question ranges
-            tab1, tab2, tab3, tab4, tab5 = st.tabs(["1-20", "21-40", "41-60", "61-80", "81-100"])
-            
-            tabs = [tab1, tab2, tab3, tab4, tab5]
-            
-            for i, tab in enumerate(tabs):
-                start_q = i * 20 + 1
-                end_q = start_q + 19
-                
-                with tab:
-                    st.subheader(f"Questions {start_q}-{end_q}")
-                    
-                    for q_num in range(start_q, end_q + 1):
-                        res = results['detailed_results'][q_num]
-                        
-                        if res['status'] == 'Correct':
-                            st.write(f"Q{q_num}: ✅ Correct (Marked: {res['marked'].upper()})")
-                        elif res['status'] == 'Incorrect':
-                            st.write(f"Q{q_num}: ❌ Incorrect (Marked: {res['marked'].upper()}, Correct: {res['correct'].upper()})")
-                        else:
-                            st.write(f"Q{q_num}: ⏭️ Not Attempted")
-            
-            # Download report
-            st.header("📥 Download Results")
-            report = processor.generate_report(results)
-            
-            st.download_button(
-                label="📄 Download Evaluation Report",
-                data=report,
-                file_name="omr_evaluation_report.txt",
-                mime="text/plain"
-            )
+            render_selected_results(processor, file_names, all_results)
             
         except Exception as e:
-            st.error(f"❌ Error processing OMR sheet: {str(e)}")
+            st.error(f"❌ Error processing OMR sheets: {str(e)}")
             st.info("Please ensure the image is clear and properly aligned.")
-        
-        finally:
-            # Clean up temporary file
-            os.unlink(temp_image_path)
     
     else:
         # Instructions
         st.info("""
         ### 📋 Instructions:
-        1. Upload a clear image of the filled OMR sheet
+        1. Upload clear images of one or more filled OMR sheets
         2. Ensure the image is well-lit and properly aligned
         3. The system will automatically detect and evaluate the answers
         4. View detailed results and download the evaluation report